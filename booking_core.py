@@ -0,0 +1,307 @@
+"""ブッキングカーブ分析の共通モジュール。
+
+booking_analyzer01-01 / 01-02 で重複していた「読み込み→成約数・売上の復元→
+宿泊日ごとのKPI集計→グラフ描画」を1か所に集約する。前処理の結果はプロセス内
+でキャッシュされるため、analyze() で両モードを続けて実行しても1回しか走らない。
+"""
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from numba import njit
+import matplotlib
+matplotlib.use('Agg') # 非対話バックエンド：表示待ちでブロックせず、図のメモリも保持しない
+import matplotlib.pyplot as plt
+import japanize_matplotlib # 日本語表示のためのライブラリ
+from joblib import Parallel, delayed
+
+plt.rcParams['figure.figsize'] = (12, 6)
+
+# 分析の粒度となるプランのキー列
+GROUP_KEYS = ['hotel_id', 'plan_id', 'room_type_id']
+
+# CSV読み込み時のdtype指定（デフォルトのint64/float64だとメモリを約2倍消費するため縮小）
+_CSV_DTYPES = {
+    'hotel_id': 'int32',
+    'plan_id': 'int32',
+    'room_type_id': 'int32',
+    'stock': 'Int32', # 欠損があり得るためnullable型で読み、dropna後にint32へ落とす
+    'price': 'float32',
+}
+
+def _load(csv_path):
+    """
+    予約データを読み込む。初回はCSVをパースして隣にParquetキャッシュを作成し、
+    2回目以降はParquet（列指向・型保持）から読み込むことでパースコストを省く。
+    """
+    cache_path = os.path.splitext(csv_path)[0] + '.parquet'
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(csv_path):
+        return pd.read_parquet(cache_path, engine='pyarrow')
+    # pyarrowエンジンはCSVをマルチスレッドでパースする（Cエンジンはシングルスレッド）
+    df = pd.read_csv(csv_path, parse_dates=['date', 'created_at'], dtype=_CSV_DTYPES, engine='pyarrow')
+    df.to_parquet(cache_path, engine='pyarrow', compression='snappy')
+    return df
+
+@njit(cache=True)
+def _compute_sold(stock, group_id):
+    """在庫の前スナップショットとの差分から成約数を復元する（グループ先頭行は0）。"""
+    n = stock.shape[0]
+    out = np.empty(n, np.float32)
+    if n > 0:
+        out[0] = 0.0
+    for i in range(1, n):
+        if group_id[i] != group_id[i - 1]:
+            out[i] = 0.0
+        else:
+            d = stock[i - 1] - stock[i]
+            out[i] = d if d > 0.0 else 0.0
+    return out
+
+def _div0(num, den):
+    """0割りを0として扱うベクトル化した除算（中間Seriesとfillnaマスクを作らない）。"""
+    out = np.zeros_like(num, dtype=np.float32)
+    np.divide(num, den, out=out, where=den > 0)
+    return out
+
+def build_daily_kpi(csv_path, min_stock=30):
+    """
+    予約データを読み込み、(前処理済みの行レベルDataFrame, 宿泊日ごとのKPI) を返す。
+
+    daily_kpi には total_revenue / total_sold / max_stock / RevPAR / ADR /
+    booking_rate_at_120_days / last_30_days_booking_ratio が含まれる。
+    同一ファイル（パス+更新時刻）に対する結果はプロセス内でキャッシュされる。
+    呼び出し側は返されたDataFrameを直接変更しないこと。
+    """
+    # ファイル更新時刻をキャッシュキーに含め、CSV差し替え時は再計算させる
+    return _build_daily_kpi_cached(csv_path, os.path.getmtime(csv_path), min_stock)
+
+@lru_cache(maxsize=2)
+def _build_daily_kpi_cached(csv_path, mtime, min_stock):
+    # --- 1. データの読み込みと前処理 ---
+    df = _load(csv_path)
+    # 日付列はCSV/Parquetどちらの経路でもパース済み。再パースせず、型だけ防御的に確認する
+    if df['created_at'].dtype.kind != 'M':
+        df['created_at'] = pd.to_datetime(df['created_at'])
+    if df['date'].dtype.kind != 'M':
+        df['date'] = pd.to_datetime(df['date'])
+    # 欠損チェックは分析に使う列に限定する（全列スキャンを避ける）
+    df.dropna(subset=['stock', 'price', 'created_at', 'date'], inplace=True)
+    # 欠損行を落とした後はnullable型から通常のint32へ戻す（以降のnumpy変換を速く保つ）
+    df['stock'] = df['stock'].astype('int32')
+
+    # IDキーはCategoricalへ変換：以後のgroupbyは因子化済みの整数コードで
+    # ハッシュされるため、int64キーよりもバイト数・ハッシュコストが減る
+    for c in GROUP_KEYS:
+        df[c] = df[c].astype('category')
+
+    # --- 2. 成約数・売上の復元 ---
+    # transformなら1回のハッシュグループ化でそのまま列に書き戻せる（自己マージ不要）
+    df['max_stock'] = df.groupby(GROUP_KEYS, sort=False, observed=True)['stock'].transform('max')
+    # 以降の処理はこの1参照に対して行うので、防御的なフルコピーは不要
+    df = df.loc[df['max_stock'] >= min_stock].reset_index(drop=True)
+
+    df.sort_values(GROUP_KEYS + ['date', 'created_at'], inplace=True)
+    # ソート済み配列上で shift→差分→clip→グループ境界リセット を1ループに融合
+    # （numpy版で必要だったシフト/差分/クリップの中間バッファを全て省く）
+    group_id = pd.util.hash_pandas_object(df[GROUP_KEYS + ['date']], index=False).to_numpy()
+    df['sold'] = _compute_sold(df['stock'].to_numpy(dtype=np.float32), group_id)
+    df['revenue'] = df['sold'] * df['price']
+
+    # --- 3. 宿泊日ごとのKPIを集計 ---
+    # 先行予約/直前予約の判定はマスク付き合計としてKPI集計に融合
+    # （フィルタ→groupby→マージの3パスをgroupby1回に削減）
+    created_at = df['created_at'].to_numpy()
+    cutoff_120 = (df['date'] - pd.Timedelta(days=120)).to_numpy()
+    cutoff_30 = (df['date'] - pd.Timedelta(days=30)).to_numpy()
+    sold_vals = df['sold'].to_numpy()
+    df['b120'] = np.where(created_at < cutoff_120, sold_vals, 0.0)
+    df['l30'] = np.where(created_at >= cutoff_30, sold_vals, 0.0)
+
+    daily_kpi = df.groupby(GROUP_KEYS + ['date'], sort=False, observed=True).agg(
+        total_revenue=('revenue', 'sum'),
+        total_sold=('sold', 'sum'),
+        max_stock=('max_stock', 'first'),
+        sold_before_120=('b120', 'sum'),
+        sold_last_30=('l30', 'sum')
+    ).reset_index()
+    daily_kpi = daily_kpi[daily_kpi['total_sold'] > 0] # 販売実績ゼロの日は除外
+
+    # RevPAR / ADR / 予約率の各指標はnumpy配列上でまとめて計算する
+    rev = daily_kpi['total_revenue'].to_numpy(dtype=np.float32)
+    cap = daily_kpi['max_stock'].to_numpy(dtype=np.float32)
+    sold_total = daily_kpi['total_sold'].to_numpy(dtype=np.float32)
+    daily_kpi['RevPAR'] = _div0(rev, cap)
+    daily_kpi['ADR'] = _div0(rev, sold_total)
+    daily_kpi['booking_rate_at_120_days'] = _div0(daily_kpi['sold_before_120'].to_numpy(dtype=np.float32), cap)
+    daily_kpi['last_30_days_booking_ratio'] = _div0(daily_kpi['sold_last_30'].to_numpy(dtype=np.float32), sold_total)
+
+    # KPI集計後の行レベルデータは描画でしか使わない。マスク列などの余分な列を
+    # 落とし、以降のmerge/groupbyが運ぶバイト数を減らす
+    df = df[GROUP_KEYS + ['date', 'created_at', 'sold', 'price', 'max_stock']]
+
+    return df, daily_kpi
+
+def _pick_optimal(daily_kpi, last_minute_threshold):
+    """「駆け込み型」に絞り、プランごとにRevPARが最大の日を抽出する。"""
+    # 全体ソート→firstのO(N log N)ではなく、idxmaxの1パスで済ませる
+    cases = daily_kpi[daily_kpi['last_30_days_booking_ratio'] >= last_minute_threshold]
+    idx = cases.groupby(GROUP_KEYS, sort=False, observed=True)['RevPAR'].idxmax()
+    return cases.loc[idx].reset_index(drop=True)
+
+def _pick_peer_group(daily_kpi, last_minute_threshold, num_tiers):
+    """価格帯ピア・グループごとに「駆け込み型」でRevPARが最大の日を抽出する。"""
+    daily_kpi = daily_kpi.copy() # キャッシュ共有されたKPIを汚さないようにする
+
+    # a. プランごとの「代表価格(ADRの中央値)」を計算（transformなら自己マージ不要）
+    daily_kpi['characteristic_price'] = daily_kpi.groupby(GROUP_KEYS, sort=False, observed=True)['ADR'].transform('median')
+
+    # b. 代表価格を基に価格帯グループ（ピア・グループ）を作成
+    # 分位点＋二分探索で分類（例：3階層なら上位33%, 中位33%, 下位33%）。
+    # pd.qcut内部のソート・ラベル処理を省き、境界値の重複もedgesのuniqueで自然に潰れる
+    if num_tiers <= 3:
+        tier_labels = ['松（高価格帯）', '竹（中価格帯）', '梅（低価格帯）'][::-1][:num_tiers] # 低→高の順に生成
+    else:
+        tier_labels = [f'価格帯{i + 1}' for i in range(num_tiers)] # 4階層以上は番号ラベル（数字が大きいほど高価格帯）
+    prices = daily_kpi['characteristic_price'].to_numpy()
+    edges = np.unique(np.quantile(prices, np.linspace(0, 1, num_tiers + 1))) if prices.size else prices
+    n_buckets = len(edges) - 1 if len(edges) >= 2 else 0
+    if n_buckets == 0 or (n_buckets == 1 and num_tiers > 1):
+        # 分位点が潰れて実質1グループしか作れない場合は、従来どおり単一グループ扱い
+        print("警告: プランの種類が少ないため、価格帯を細かく分類できませんでした。1つのグループとして扱います。")
+        daily_kpi['price_tier'] = '単一グループ'
+    else:
+        tier_idx = np.clip(np.searchsorted(edges, prices, side='right') - 1, 0, n_buckets - 1)
+        # 境界の重複で階層数が減った場合も、最上位の価格帯が最上位ラベルを保つよう上側から切り出す
+        daily_kpi['price_tier'] = pd.Categorical.from_codes(tier_idx, categories=tier_labels[-n_buckets:])
+
+    # c. 「駆け込み型」に絞り込み、各「価格帯グループ」の中でRevPARが最大の日を抽出
+    cases = daily_kpi[daily_kpi['last_30_days_booking_ratio'] >= last_minute_threshold]
+    idx = cases.groupby(['price_tier'], sort=False, observed=True)['RevPAR'].idxmax()
+    return cases.loc[idx].reset_index(drop=True)
+
+def _optimal_title(g):
+    """「駆け込み型」モードのグラフタイトル。"""
+    return (
+        f"「駆け込み型」最適ブッキングカーブ (宿泊日: {g.date.strftime('%Y-%m-%d')})\n"
+        f"Plan: {g.plan_id}, Room: {g.room_type_id}\n"
+        f"【RevPAR: {g.RevPAR:,.0f}円】 【直前30日予約率: {g.last_30_days_booking_ratio:.1%}】"
+    )
+
+def _peer_group_title(g):
+    """ピア・グループモードのグラフタイトル。"""
+    return (
+        f"【{g.price_tier}のベストプラクティス】 (宿泊日: {g.date.strftime('%Y-%m-%d')})\n"
+        f"Plan: {g.plan_id}, Room: {g.room_type_id}\n"
+        f"RevPAR: {g.RevPAR:,.0f}円 | 直前30日予約率: {g.last_30_days_booking_ratio:.1%}"
+    )
+
+def _render_booking_curve(days, sold, price, g, mode, title_fmt, out_dir):
+    """
+    1枚のブッキングカーブを描画してPNGに保存する。
+    joblibワーカーから呼ばれるため、引数はnumpy配列と1行分のKPIのみ。
+    """
+    # 日付軸はソート済みなので、120日カットオフでの分割は二分探索1回で済む
+    cutoff = np.datetime64(g.date - pd.Timedelta(days=120))
+    cut_idx = np.searchsorted(days, cutoff)
+    sold_before = sold[:cut_idx].sum()
+    curve_days = days[cut_idx:]
+    sold_cumsum = np.cumsum(sold[cut_idx:]) + sold_before
+    daily_price = price[cut_idx:]
+
+    # グラフ作成
+    fig, ax1 = plt.subplots()
+    ax2 = ax1.twinx()
+
+    # 左Y軸：累計予約数
+    ax1.plot(curve_days, sold_cumsum, color='mediumseagreen', label='累計予約数', marker='o', markersize=4, linestyle='-')
+    ax1.set_ylabel('累計予約数', color='mediumseagreen', fontsize=12)
+    ax1.axhline(y=g.max_stock, color='grey', linestyle='--', label=f"満室ライン ({int(g.max_stock)}室)")
+    ax1.set_ylim(bottom=0)
+
+    # 右Y軸：価格
+    ax2.step(curve_days, daily_price, where='post', color='tomato', label='価格')
+    ax2.set_ylabel('価格 (JPY)', color='tomato', fontsize=12)
+
+    # タイトルにKPI情報を集約
+    plt.title(title_fmt(g), fontsize=14, pad=20)
+
+    ax1.set_xlabel('予約日', fontsize=12)
+    ax1.grid(True, linestyle=':', linewidth=0.7)
+
+    lines, labels = ax1.get_legend_handles_labels()
+    lines2, labels2 = ax2.get_legend_handles_labels()
+    ax2.legend(lines + lines2, labels + labels2, loc='upper left')
+
+    plt.tight_layout(rect=[0, 0, 1, 0.95]) # タイトルが重ならないように調整
+    # 表示ではなくファイルへ書き出し、figureを即時解放する（K枚描いてもRSSが増えない）
+    # 同じプラン・宿泊日が複数モードで選ばれても上書きしないよう、ファイル名にモードを含める
+    out_path = os.path.join(out_dir, f"{mode}_{g.hotel_id}_{g.plan_id}_{g.room_type_id}_{g.date:%Y%m%d}.png")
+    fig.savefig(out_path, dpi=120, bbox_inches='tight')
+    plt.close(fig)
+    return out_path
+
+def _plot_booking_curves(df, best_dates, mode, title_fmt, out_dir):
+    """選定済みのbest_datesについてブッキングカーブを描画し、out_dirへ保存する。"""
+    print(f"分析対象となる {len(best_dates)} 個の最適なブッキングカーブを描画します。")
+    os.makedirs(out_dir, exist_ok=True)
+    # 描画に必要な行だけを抽出し、日次カーブ（成約数合計・平均価格）を
+    # groupby1回で全プロット分まとめて前計算する（ループ内groupbyのセットアップ費を償却）
+    plot_rows = df.merge(best_dates[GROUP_KEYS + ['date']], on=GROUP_KEYS + ['date'], how='inner')
+    plot_rows['created_at_norm'] = plot_rows['created_at'].to_numpy().astype('datetime64[D]')
+    # 数値列はC連続のfloat32に揃えておく（merge後の断片化した列レイアウトを正す）
+    for c in ('sold', 'price'):
+        plot_rows[c] = np.ascontiguousarray(plot_rows[c].to_numpy(dtype=np.float32))
+    precomp = plot_rows.groupby(GROUP_KEYS + ['date', 'created_at_norm'], sort=True, observed=True).agg(
+        sold=('sold', 'sum'),
+        price=('price', 'mean')
+    )
+    # 各プロットは前計算済みカーブだけに依存する独立な処理なので、
+    # Aggでのレンダリングをコア数ぶん並列化する（ワーカーへはnumpy配列のみ渡す）
+    tasks = []
+    # iterrowsの行Series生成＋ラベル参照のコストを避け、軽量なnamedtupleで回す
+    for g in best_dates.itertuples(index=False):
+        curve = precomp.loc[(g.hotel_id, g.plan_id, g.room_type_id, g.date)]
+        # matplotlibにはSeriesではなく生のndarrayを渡す（per-callの_values展開を避ける）
+        tasks.append(delayed(_render_booking_curve)(
+            curve.index.to_numpy(), curve['sold'].to_numpy(), curve['price'].to_numpy(), g, mode, title_fmt, out_dir))
+    Parallel(n_jobs=-1)(tasks)
+
+    print(f"グラフを {out_dir} に保存しました。")
+
+def analyze(csv_path, modes=('optimal', 'peer_group'), last_minute_threshold=0.5, num_tiers=3, out_dir='booking_curves'):
+    """
+    予約データを分析し、モードごとのベストプラクティスを可視化する共通エントリポイント。
+
+    前処理（読み込み〜日次KPI集計）は1回だけ実行し、modesで指定された
+    選定ロジックだけを切り替える。両モードを一度に実行しても前処理は共有される。
+
+    Args:
+        csv_path (str): 分析対象のCSVファイルパス
+        modes (tuple): 'optimal'（プランごとの駆け込み型）/ 'peer_group'（価格帯ごと）の組み合わせ
+        last_minute_threshold (float): 「駆け込み型」と判断する直前予約率の閾値
+        num_tiers (int): peer_groupモードで価格帯をいくつの階層に分けるか
+        out_dir (str): グラフ(PNG)の保存先ディレクトリ
+    """
+    # --- 1. 共通前処理 ---
+    print("データの読み込みと前処理を開始します...")
+    try:
+        df, daily_kpi = build_daily_kpi(csv_path)
+    except FileNotFoundError:
+        print(f"エラー: ファイルが見つかりません。パスを確認してください: {csv_path}")
+        return
+
+    # --- 2. モードごとのベストプラクティス選定と描画 ---
+    for mode in modes:
+        if mode == 'optimal':
+            print("「駆け込み型」の成功事例を選定中...")
+            best_dates = _pick_optimal(daily_kpi, last_minute_threshold)
+            title_fmt = _optimal_title
+        elif mode == 'peer_group':
+            print("各ピア・グループのベストプラクティスを選定中...")
+            best_dates = _pick_peer_group(daily_kpi, last_minute_threshold, num_tiers)
+            title_fmt = _peer_group_title
+        else:
+            print(f"警告: 未知のモードをスキップします: {mode}")
+            continue
+        _plot_booking_curves(df, best_dates, mode, title_fmt, out_dir)